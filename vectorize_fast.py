@@ -5,6 +5,9 @@ Fast vectorization using potrace + efficient gap insertion for laser cutting.
 Requirements:
     pip install numpy opencv-python-headless svgpathtools
     sudo apt install potrace  # or brew install potrace on macOS
+    pip install numba  # optional, JIT-compiles the gap insertion kernels (--numba)
+    pip install lxml   # optional, faster SVG parsing
+    pip install tqdm   # optional, progress bar for gap insertion
 
 Usage:
     python vectorize_fast.py \
@@ -21,12 +24,17 @@ Features:
 """
 
 import argparse
+import hashlib
+import io
+import multiprocessing
+import re
 import subprocess
-import tempfile
-import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-import xml.etree.ElementTree as ET
-from typing import List, Tuple
+from typing import List, Tuple, Union
+from xml.sax.saxutils import quoteattr
 import math
 
 try:
@@ -42,6 +50,24 @@ except ImportError:
     print("Error: svgpathtools not found. Install with: pip install svgpathtools")
     exit(1)
 
+try:
+    # lxml's C parser is much faster on large potrace output
+    from lxml import etree as ET
+    HAVE_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    HAVE_LXML = False
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
 
 def check_potrace():
     """Check if potrace is installed."""
@@ -58,251 +84,786 @@ def check_potrace():
         return False
 
 
-def convert_to_pbm(input_png: str, output_pbm: str, threshold: int = 128):
+def load_binary_image(input_png: str, threshold: int = 128,
+                      otsu: bool = False) -> np.ndarray:
     """
-    Convert PNG to PBM format for potrace.
-    Potrace only accepts PNM/BMP formats.
+    Read an image as grayscale and threshold it to black and white.
+    Returns a uint8 mask holding 1 for black (foreground) pixels and 0
+    for white, ready to be bit-packed for PBM.
+
+    With otsu=True the threshold is picked automatically and the
+    threshold argument is ignored.
     """
     img = cv2.imread(input_png, cv2.IMREAD_GRAYSCALE)
     if img is None:
         raise FileNotFoundError(f"Could not read image: {input_png}")
 
-    # Threshold to binary (black and white only)
-    _, binary = cv2.threshold(img, threshold, 255, cv2.THRESH_BINARY)
+    # Inverted threshold: potrace traces black, so black pixels become 1
+    flags = cv2.THRESH_BINARY_INV
+    if otsu:
+        flags |= cv2.THRESH_OTSU
+    used, binary = cv2.threshold(img, threshold, 1, flags)
+    if otsu:
+        print(f"  Otsu threshold: {used:.0f}")
+    return binary
 
-    # Write as PBM (portable bitmap format)
-    # PBM format: P4 (binary) or P1 (ASCII)
-    # We'll use cv2 to write as BMP which potrace also accepts
-    cv2.imwrite(output_pbm, binary)
-    return output_pbm
 
+def encode_pbm(img_binary: np.ndarray) -> bytes:
+    """
+    Encode a black and white mask (nonzero = black) as binary PBM (P4).
 
-def vectorize_with_potrace(input_png: str, output_svg: str) -> str:
+    P4 stores 1 bit per pixel, 1 = black, MSB first, with each row padded
+    to a whole byte, which is exactly the layout np.packbits produces.
+    """
+    h, w = img_binary.shape
+    header = b"P4\n%d %d\n" % (w, h)
+    return header + np.packbits(img_binary, axis=1).tobytes()
+
+
+def vectorize_with_potrace(input_png: str, threshold: int = 128,
+                           otsu: bool = False) -> bytes:
     """
     Use potrace to vectorize the PNG to SVG.
-    Returns path to the generated SVG.
+    Returns the generated SVG document, read from potrace's stdout.
     """
     print(f"Vectorizing {input_png} with potrace...")
 
-    # Convert PNG to BMP format (potrace requirement)
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.bmp', delete=False) as tmp:
-        tmp_bmp = tmp.name
+    # The bitmap is piped to potrace on stdin, no temp file needed
+    pbm_bytes = encode_pbm(load_binary_image(input_png, threshold, otsu))
+
+    # potrace parameters:
+    # -s = SVG output
+    # -k 0.5 = corner threshold (lower = sharper corners)
+    # -t 2 = suppress speckles of this size
+    # -O 1.0 = curve optimization tolerance
+    cmd = [
+        'potrace',
+        '-s',           # SVG output
+        '-k', '0.5',    # corner threshold
+        '-t', '2',      # suppress small speckles
+        '-O', '1.0',    # optimization tolerance
+        '-o', '-',      # write SVG to stdout
+        '-'             # read bitmap from stdin
+    ]
 
     try:
-        convert_to_pbm(input_png, tmp_bmp)
-
-        # potrace parameters:
-        # -s = SVG output
-        # -k 0.5 = corner threshold (lower = sharper corners)
-        # -t 2 = suppress speckles of this size
-        # -O 1.0 = curve optimization tolerance
-        cmd = [
-            'potrace',
-            '-s',           # SVG output
-            '-k', '0.5',    # corner threshold
-            '-t', '2',      # suppress small speckles
-            '-O', '1.0',    # optimization tolerance
-            '-o', output_svg,
-            tmp_bmp
-        ]
-
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        result = subprocess.run(cmd, input=pbm_bytes, capture_output=True, check=True)
         print(f"✓ Vectorization complete")
-        return output_svg
+        return result.stdout
     except subprocess.CalledProcessError as e:
-        print(f"Error running potrace: {e.stderr}")
+        print(f"Error running potrace: {e.stderr.decode(errors='replace')}")
         raise
-    finally:
-        # Clean up temp BMP
-        if os.path.exists(tmp_bmp):
-            os.unlink(tmp_bmp)
 
 
-def parse_svg_paths(svg_file: str) -> Tuple[List[SvgPath], dict]:
+def extract_svg_d_strings(svg: Union[str, bytes]) -> Tuple[List[str], dict]:
     """
-    Parse SVG and extract all path data.
-    Returns list of Path objects and SVG attributes.
+    Extract the d attribute of every path in an SVG.
+    Accepts a file name or the SVG document itself as bytes.
+    Returns list of d strings and SVG attributes.
+
+    The file is streamed with iterparse and each path element is dropped
+    as soon as it has been read, so the full DOM is never held in memory.
+    """
+    source = io.BytesIO(svg) if isinstance(svg, bytes) else svg
+    if HAVE_LXML:
+        context = ET.iterparse(source, events=('start', 'end'),
+                               huge_tree=True, remove_blank_text=True)
+    else:
+        context = ET.iterparse(source, events=('start', 'end'))
+
+    svg_attrs = None
+    d_strings = []
+    open_elems = []
+    for event, elem in context:
+        # Match on local name so namespaced and bare tags are handled alike
+        name = elem.tag.rsplit('}', 1)[-1]
+
+        if event == 'start':
+            open_elems.append(elem)
+            # Extract viewBox or dimensions from the root element
+            if svg_attrs is None and name == 'svg':
+                svg_attrs = {
+                    'viewBox': elem.get('viewBox', ''),
+                    'width': elem.get('width', '100%'),
+                    'height': elem.get('height', '100%')
+                }
+            continue
+
+        open_elems.pop()
+        if name != 'path':
+            continue
+
+        d = elem.get('d', '')
+        if d:
+            d_strings.append(d)
+
+        # Free the element immediately
+        elem.clear()
+        if open_elems:
+            open_elems[-1].remove(elem)
+
+    if svg_attrs is None:
+        svg_attrs = {'viewBox': '', 'width': '100%', 'height': '100%'}
+
+    return d_strings, svg_attrs
+
+
+# potrace only emits M/m, C/c, L/l and Z/z with plain decimal numbers
+_POTRACE_TOKEN = re.compile(r'[MmZzCcLl]|-?(?:\d+(?:\.\d*)?|\.\d+)')
+_POTRACE_UNSUPPORTED = re.compile(r'[^MmZzCcLl0-9.\-\s,]')
+
+
+def parse_potrace_d(d: str) -> np.ndarray:
     """
-    tree = ET.parse(svg_file)
-    root = tree.getroot()
+    Parse a potrace path d string straight into cubic control points.
 
-    # Extract viewBox or dimensions
-    ns = {'svg': 'http://www.w3.org/2000/svg'}
+    Handles only the subset potrace writes (moves, cubics, lines and
+    closepath, absolute or relative). Lines are degree-elevated to
+    cubics and closepath adds a closing line, as svgpathtools does.
 
-    viewbox = root.get('viewBox', '')
-    width = root.get('width', '100%')
-    height = root.get('height', '100%')
+    Returns:
+        float64 array of shape (N, 4, 2)
 
-    svg_attrs = {
-        'viewBox': viewbox,
-        'width': width,
-        'height': height
-    }
+    Raises:
+        ValueError: if the string uses anything outside that subset
+    """
+    if _POTRACE_UNSUPPORTED.search(d):
+        raise ValueError("not a potrace path")
+
+    tokens = _POTRACE_TOKEN.findall(d)
+    segments = []
+    cx = cy = 0.0   # current point
+    sx = sy = 0.0   # start of the current subpath
+    cmd = None
+    i = 0
+    n = len(tokens)
+    while i < n:
+        tok = tokens[i]
+        if tok in 'MmZzCcLl':
+            cmd = tok
+            i += 1
+            if cmd in 'Zz':
+                if cx != sx or cy != sy:
+                    segments.append((cx, cy, cx + (sx - cx) / 3.0, cy + (sy - cy) / 3.0,
+                                     cx + 2.0 * (sx - cx) / 3.0, cy + 2.0 * (sy - cy) / 3.0,
+                                     sx, sy))
+                cx, cy = sx, sy
+            continue
+
+        if cmd in ('M', 'm'):
+            x, y = float(tokens[i]), float(tokens[i + 1])
+            if cmd == 'm':
+                x += cx
+                y += cy
+            cx, cy = sx, sy = x, y
+            # Further coordinate pairs after a move are implicit lines
+            cmd = 'L' if cmd == 'M' else 'l'
+            i += 2
+        elif cmd in ('C', 'c'):
+            x1, y1, x2, y2, x, y = [float(v) for v in tokens[i:i + 6]]
+            if cmd == 'c':
+                x1 += cx
+                y1 += cy
+                x2 += cx
+                y2 += cy
+                x += cx
+                y += cy
+            segments.append((cx, cy, x1, y1, x2, y2, x, y))
+            cx, cy = x, y
+            i += 6
+        elif cmd in ('L', 'l'):
+            x, y = float(tokens[i]), float(tokens[i + 1])
+            if cmd == 'l':
+                x += cx
+                y += cy
+            segments.append((cx, cy, cx + (x - cx) / 3.0, cy + (y - cy) / 3.0,
+                             cx + 2.0 * (x - cx) / 3.0, cy + 2.0 * (y - cy) / 3.0,
+                             x, y))
+            cx, cy = x, y
+            i += 2
+        else:
+            raise ValueError("path data does not start with a command")
+
+    return np.array(segments, dtype=np.float64).reshape(-1, 4, 2)
+
+
+def _parse_d(d: str):
+    """
+    Parse one d string into cubic control points, or None if malformed.
+
+    The potrace fast path is tried first; anything it does not handle
+    goes through svgpathtools.
+    """
+    try:
+        return parse_potrace_d(d)
+    except (ValueError, IndexError):
+        pass
+    try:
+        return path_to_ctrl(parse_path(d))
+    except Exception as e:
+        print(f"Warning: Could not parse path: {e}")
+        return None
 
-    paths = []
-    for path_elem in root.findall('.//svg:path', ns):
-        d = path_elem.get('d', '')
-        if d:
-            try:
-                path = parse_path(d)
-                paths.append(path)
-            except Exception as e:
-                print(f"Warning: Could not parse path: {e}")
-
-    # Also check paths without namespace
-    for path_elem in root.findall('.//path'):
-        d = path_elem.get('d', '')
-        if d:
-            try:
-                path = parse_path(d)
-                paths.append(path)
-            except Exception as e:
-                print(f"Warning: Could not parse path: {e}")
+
+def parse_svg_paths(svg: Union[str, bytes], jobs: int = 1) -> Tuple[List[np.ndarray], dict]:
+    """
+    Parse SVG and extract all path data.
+    Accepts a file name or the SVG document itself as bytes.
+    Returns list of cubic control-point arrays (one per path) and SVG
+    attributes.
+
+    All d strings are collected (and the XML released) before any path is
+    parsed; with jobs > 1 the parsing is spread over worker processes.
+    """
+    d_strings, svg_attrs = extract_svg_d_strings(svg)
+
+    if jobs > 1 and len(d_strings) > 1:
+        with ProcessPoolExecutor(jobs) as executor:
+            parsed = list(executor.map(_parse_d, d_strings, chunksize=256))
+    else:
+        parsed = [_parse_d(d) for d in d_strings]
+    paths = [path for path in parsed if path is not None]
 
     print(f"✓ Extracted {len(paths)} paths from SVG")
     return paths, svg_attrs
 
 
-def insert_gaps_in_path(path: SvgPath, gap_length: float, gap_spacing: float) -> List[SvgPath]:
+# Gauss-Legendre quadrature (order 8) mapped from [-1, 1] onto [0, 1]
+_GL_NODES, _GL_WEIGHTS = np.polynomial.legendre.leggauss(8)
+_GL_NODES = 0.5 * (_GL_NODES + 1.0)
+_GL_WEIGHTS = 0.5 * _GL_WEIGHTS
+
+# Parameter samples used to invert arc length -> t within a segment
+ARCLENGTH_SAMPLES = 32
+_T_SAMPLES = np.linspace(0.0, 1.0, ARCLENGTH_SAMPLES)
+
+
+def _bernstein(t: np.ndarray) -> np.ndarray:
+    """Cubic Bernstein basis evaluated at t, shape (len(t), 4)."""
+    mt = 1.0 - t
+    return np.stack([mt ** 3, 3 * mt ** 2 * t, 3 * mt * t ** 2, t ** 3], axis=-1)
+
+
+def _bernstein_deriv(t: np.ndarray) -> np.ndarray:
+    """Derivative of the cubic Bernstein basis at t, shape (len(t), 4)."""
+    mt = 1.0 - t
+    return np.stack([-3 * mt ** 2,
+                     3 * mt ** 2 - 6 * mt * t,
+                     6 * mt * t - 3 * t ** 2,
+                     3 * t ** 2], axis=-1)
+
+
+# Geometry is stored as float32 (potrace's traced coordinates carry far
+# less precision than that); only running sums along a path use float64
+COORD_DTYPE = np.float32
+
+_GL_DERIV_BASIS = _bernstein_deriv(_GL_NODES).astype(COORD_DTYPE)
+_GL_WEIGHTS_32 = _GL_WEIGHTS.astype(COORD_DTYPE)
+_SAMPLE_BASIS = _bernstein(_T_SAMPLES).astype(COORD_DTYPE)
+
+
+def path_to_ctrl(path: SvgPath) -> np.ndarray:
     """
-    Insert gaps along a path at regular intervals.
+    Flatten an svgpathtools path into cubic control points.
 
-    Args:
-        path: SVG path object
-        gap_length: Length of each gap
-        gap_spacing: Distance between gap starts
+    Lines and quadratics are degree-elevated to cubics; arcs are
+    approximated with cubics.
 
     Returns:
-        List of path segments (gaps removed)
+        float64 array of shape (N, 4, 2)
     """
-    if len(path) == 0:
-        return []
+    points = []
+    for seg in path:
+        if isinstance(seg, Line):
+            d = seg.end - seg.start
+            points.append((seg.start, seg.start + d / 3.0,
+                           seg.start + 2.0 * d / 3.0, seg.end))
+        elif isinstance(seg, QuadraticBezier):
+            points.append((seg.start,
+                           seg.start + 2.0 * (seg.control - seg.start) / 3.0,
+                           seg.end + 2.0 * (seg.control - seg.end) / 3.0,
+                           seg.end))
+        elif isinstance(seg, CubicBezier):
+            points.append((seg.start, seg.control1, seg.control2, seg.end))
+        elif isinstance(seg, Arc):
+            curves = max(1, math.ceil(abs(seg.delta) / 90.0))
+            for cub in seg.as_cubic_curves(curves):
+                points.append((cub.start, cub.control1, cub.control2, cub.end))
+
+    pts = np.array(points, dtype=complex).reshape(-1, 4)
+    return np.stack([pts.real, pts.imag], axis=-1)
+
+
+# Segment kinds; every segment is stored as a cubic, the kind records
+# what it was before degree elevation
+SEG_LINE, SEG_QUAD, SEG_CUBIC = 0, 1, 2
+
+
+def segment_kinds(ctrl: np.ndarray) -> np.ndarray:
+    """
+    Classify cubic segments as degree-elevated lines, quadratics or true cubics.
 
-    total_length = path.length()
-    if total_length == 0:
-        return [path]
+    Returns:
+        uint8 array of SEG_LINE / SEG_QUAD / SEG_CUBIC, shape (N,)
+    """
+    p0, p1, p2, p3 = ctrl[:, 0], ctrl[:, 1], ctrl[:, 2], ctrl[:, 3]
+    line_err = np.maximum(np.abs(3.0 * p1 - 2.0 * p0 - p3).max(axis=-1),
+                          np.abs(3.0 * p2 - p0 - 2.0 * p3).max(axis=-1))
+    # An elevated quadratic has 3*P1 - P0 == 3*P2 - P3 (both are 2*Q)
+    quad_err = np.abs(3.0 * p1 - p0 - 3.0 * p2 + p3).max(axis=-1)
+
+    kinds = np.full(len(ctrl), SEG_CUBIC, dtype=np.uint8)
+    kinds[quad_err < 1e-6] = SEG_QUAD
+    kinds[line_err < 1e-6] = SEG_LINE
+    return kinds
+
+
+def shape_key(ctrl: np.ndarray) -> bytes:
+    """
+    Digest of a path's geometry relative to its first point.
+
+    Translated copies of a shape get the same key. Coordinates are rounded
+    to 1e-6 so float noise from the translation does not split keys; this
+    only holds at float64, as float32 noise near 1e4 is around 1e-3.
+    """
+    if len(ctrl) == 0:
+        return b''
+    # + 0.0 folds -0.0 into 0.0 so both round to the same bytes
+    shape = np.round(ctrl - ctrl[0, 0], 6) + 0.0
+    return hashlib.blake2b(shape.tobytes(), digest_size=16).digest()
+
+
+@dataclass
+class PathBatch:
+    """
+    Every path of a drawing packed into contiguous arrays.
+
+    Path i owns segments ctrl[path_offsets[i]:path_offsets[i + 1]].
+    """
+    ctrl: np.ndarray          # (Ntot, 4, 2) float32 cubic control points
+    path_offsets: np.ndarray  # (Npath + 1,) int32
+    kinds: np.ndarray         # (Ntot,) uint8 SEG_LINE / SEG_QUAD / SEG_CUBIC
+    shape_keys: List[bytes]   # (Npath,) digests from shape_key
+
+    @classmethod
+    def from_paths(cls, paths: List[np.ndarray]) -> 'PathBatch':
+        """
+        Pack per-path control-point arrays into one batch.
+
+        Segments are classified and shape keys are taken at full
+        precision before the control points are narrowed to COORD_DTYPE.
+        """
+        offsets = np.zeros(len(paths) + 1, dtype=np.int32)
+        np.cumsum([len(p) for p in paths], out=offsets[1:])
+        ctrl = np.concatenate(paths) if paths else np.empty((0, 4, 2))
+        return cls(ctrl.astype(COORD_DTYPE), offsets, segment_kinds(ctrl),
+                   [shape_key(p) for p in paths])
+
+    def __len__(self) -> int:
+        return len(self.path_offsets) - 1
+
+
+def _curve_arclengths(ctrl: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Gauss-Legendre lengths and scaled sample tables for cubic curves."""
+    deriv = np.einsum('kj,njd->nkd', _GL_DERIV_BASIS, ctrl)
+    seg_lengths = np.linalg.norm(deriv, axis=-1) @ _GL_WEIGHTS_32
+
+    pts = np.einsum('kj,njd->nkd', _SAMPLE_BASIS, ctrl)
+    chords = np.linalg.norm(np.diff(pts, axis=1), axis=-1)
+    seg_tables = np.zeros((len(ctrl), ARCLENGTH_SAMPLES), dtype=chords.dtype)
+    np.cumsum(chords, axis=1, out=seg_tables[:, 1:])
+
+    polyline = seg_tables[:, -1:]
+    scale = np.divide(seg_lengths[:, None], polyline,
+                      out=np.zeros_like(polyline), where=polyline > 0)
+    seg_tables *= scale
+    return seg_lengths, seg_tables
+
+
+def segment_arclengths(ctrl: np.ndarray, kinds: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute arc lengths for many cubic segments in one vectorized pass.
+
+    Straight lines (which potrace emits plenty of) are measured in closed
+    form with np.hypot; since a degree-elevated line has constant speed,
+    its table is simply linear in t. Curved segments use Gauss-Legendre
+    quadrature of |dP/dt|, with the length distributed over a polyline
+    sampled at ARCLENGTH_SAMPLES parameter values so arc length -> t
+    lookups need no further integration.
+
+    Args:
+        ctrl: Control points, shape (N, 4, 2)
+        kinds: Segment kinds from segment_kinds, shape (N,)
 
-    # Calculate gap positions along the path
-    gap_positions = []  # List of (gap_start, gap_end) tuples
+    Returns:
+        (seg_lengths, seg_tables) where seg_lengths has shape (N,) and
+        seg_tables[i, k] is the arc length from t=0 to _T_SAMPLES[k],
+        both in the dtype of ctrl
+    """
+    is_line = kinds == SEG_LINE
+    seg_lengths = np.empty(len(ctrl), dtype=ctrl.dtype)
+    seg_tables = np.empty((len(ctrl), ARCLENGTH_SAMPLES), dtype=ctrl.dtype)
+
+    chord = ctrl[is_line, 3] - ctrl[is_line, 0]
+    line_lengths = np.hypot(chord[:, 0], chord[:, 1])
+    seg_lengths[is_line] = line_lengths
+    seg_tables[is_line] = line_lengths[:, None] * _T_SAMPLES
+
+    is_curve = ~is_line
+    seg_lengths[is_curve], seg_tables[is_curve] = _curve_arclengths(ctrl[is_curve])
+    return seg_lengths, seg_tables
+
+
+def _locate(s: np.ndarray, cum_lengths: np.ndarray,
+            seg_tables: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert arc lengths along a path to (segment indices, local t)."""
+    idx = np.searchsorted(cum_lengths, s, side='right') - 1
+    idx = np.clip(idx, 0, len(seg_tables) - 1)
+    local = s - cum_lengths[idx]
+
+    rows = seg_tables[idx]
+    j = np.clip((rows <= local[:, None]).sum(axis=1) - 1, 0, ARCLENGTH_SAMPLES - 2)
+    lo = np.take_along_axis(rows, j[:, None], axis=1)[:, 0]
+    hi = np.take_along_axis(rows, j[:, None] + 1, axis=1)[:, 0]
+    span = hi - lo
+    frac = np.divide(local - lo, span, out=np.zeros_like(local), where=span > 0)
+    t = _T_SAMPLES[j] + np.clip(frac, 0.0, 1.0) * (_T_SAMPLES[j + 1] - _T_SAMPLES[j])
+    return idx, t
+
+
+def _split_cubic(c: np.ndarray, t0: float, t1: float) -> np.ndarray:
+    """Control points of the part of cubic c between t0 and t1 (de Casteljau)."""
+    # Split at t1 and keep the left half
+    a = c[:3] * (1.0 - t1) + c[1:] * t1
+    b = a[:2] * (1.0 - t1) + a[1:] * t1
+    left = np.empty((4, 2))
+    left[0] = c[0]
+    left[1] = a[0]
+    left[2] = b[0]
+    left[3] = b[0] * (1.0 - t1) + b[1] * t1
+
+    # Split the left half at t0 (rescaled) and keep the right half
+    u = t0 / t1 if t1 > 0.0 else 0.0
+    a = left[:3] * (1.0 - u) + left[1:] * u
+    b = a[:2] * (1.0 - u) + a[1:] * u
+    out = np.empty((4, 2))
+    out[0] = b[0] * (1.0 - u) + b[1] * u
+    out[1] = b[1]
+    out[2] = a[2]
+    out[3] = left[3]
+    return out
+
+
+def _place_gaps(total_length: float, gap_length: float,
+                gap_spacing: float) -> np.ndarray:
+    """
+    Calculate gap positions along a path.
 
+    Returns:
+        Array of shape (G, 2) holding (gap_start, gap_end) arc lengths
+    """
     # If path is shorter than gap_spacing, put one gap in the middle
     if total_length < gap_spacing:
         mid = total_length / 2.0
-        gap_start = max(0, mid - gap_length / 2.0)
+        gap_start = max(0.0, mid - gap_length / 2.0)
         gap_end = min(total_length, mid + gap_length / 2.0)
 
         # Only add gap if it doesn't consume the entire path
         if gap_start > 0 or gap_end < total_length:
-            gap_positions.append((gap_start, gap_end))
-    else:
-        # Place gaps at regular intervals
-        pos = gap_spacing
-        while pos < total_length:
-            gap_start = pos
-            gap_end = min(pos + gap_length, total_length)
-            gap_positions.append((gap_start, gap_end))
-            pos += gap_spacing
+            gaps = np.empty((1, 2))
+            gaps[0, 0] = gap_start
+            gaps[0, 1] = gap_end
+            return gaps
+        return np.empty((0, 2))
+
+    # Place gaps at regular intervals
+    count = 0
+    pos = gap_spacing
+    while pos < total_length:
+        count += 1
+        pos += gap_spacing
+
+    gaps = np.empty((count, 2))
+    pos = gap_spacing
+    for k in range(count):
+        gaps[k, 0] = pos
+        gaps[k, 1] = min(pos + gap_length, total_length)
+        pos += gap_spacing
+    return gaps
+
+
+def _crop_pieces(ctrl: np.ndarray, kinds: np.ndarray, idx: np.ndarray,
+                 t: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Crop a path into pieces between pairs of (segment index, t) locations.
+
+    Only the bracketing segments of each piece are split; whole segments
+    in between are copied as-is. A split segment keeps its kind.
+
+    Returns:
+        (control points and kinds of all pieces concatenated, piece offsets)
+    """
+    n = len(idx) // 2
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    for k in range(n):
+        i0, i1 = idx[2 * k], idx[2 * k + 1]
+        t0, t1 = t[2 * k], t[2 * k + 1]
+        if i0 == i1:
+            count = 1 if t1 > t0 else 0
+        else:
+            count = i1 - i0 - 1
+            if t0 < 1.0:
+                count += 1
+            if t1 > 0.0:
+                count += 1
+        offsets[k + 1] = offsets[k] + count
+
+    out = np.empty((offsets[n], 4, 2))
+    out_kinds = np.empty(offsets[n], dtype=np.uint8)
+    for k in range(n):
+        i0, i1 = idx[2 * k], idx[2 * k + 1]
+        t0, t1 = t[2 * k], t[2 * k + 1]
+        o = offsets[k]
+        if i0 == i1:
+            if t1 > t0:
+                out[o] = _split_cubic(ctrl[i0], t0, t1)
+                out_kinds[o] = kinds[i0]
+            continue
+        if t0 < 1.0:
+            out[o] = _split_cubic(ctrl[i0], t0, 1.0)
+            out_kinds[o] = kinds[i0]
+            o += 1
+        out[o:o + i1 - i0 - 1] = ctrl[i0 + 1:i1]
+        out_kinds[o:o + i1 - i0 - 1] = kinds[i0 + 1:i1]
+        o += i1 - i0 - 1
+        if t1 > 0.0:
+            out[o] = _split_cubic(ctrl[i1], 0.0, t1)
+            out_kinds[o] = kinds[i1]
+    return out, out_kinds, offsets
+
+
+_NUMBA_ENABLED = False
+
+
+def enable_numba() -> bool:
+    """
+    JIT-compile the gap insertion kernels with numba in this process.
+
+    The kernels run once per path on small arrays, so compiled code is only
+    slightly faster than NumPy, while the first run spends several seconds
+    compiling in every process (cached on disk afterwards). That is why
+    numba is opt-in rather than used whenever it is installed.
+
+    Returns:
+        True if the kernels are compiled, False if numba is not installed
+    """
+    global _NUMBA_ENABLED, _split_cubic, _place_gaps, _crop_pieces
+    if numba is None:
+        return False
+    if not _NUMBA_ENABLED:
+        # _crop_pieces calls _split_cubic, so that one is rebound first
+        _split_cubic = numba.njit(cache=True, fastmath=True)(_split_cubic)
+        _place_gaps = numba.njit(cache=True)(_place_gaps)
+        _crop_pieces = numba.njit(cache=True)(_crop_pieces)
+        _NUMBA_ENABLED = True
+    return True
+
+
+def insert_gaps_in_path(ctrl: np.ndarray, kinds: np.ndarray, seg_lengths: np.ndarray,
+                        seg_tables: np.ndarray, gap_length: float,
+                        gap_spacing: float, total_length: float = None
+                        ) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Insert gaps along a path at regular intervals.
+
+    Args:
+        ctrl: Cubic control points of the path, shape (N, 4, 2)
+        kinds: Segment kinds of the path, shape (N,)
+        seg_lengths, seg_tables: Arc-length data from segment_arclengths
+        gap_length: Length of each gap
+        gap_spacing: Distance between gap starts
+        total_length: Precomputed path length (summed here if omitted)
+
+    Returns:
+        List of (control points, kinds) pairs, one per path segment (gaps
+        removed)
+    """
+    if len(ctrl) == 0:
+        return []
+
+    if total_length is None:
+        total_length = float(seg_lengths.sum(dtype=np.float64))
+    if total_length == 0:
+        return [(ctrl, kinds)]
+
+    gaps = _place_gaps(total_length, gap_length, gap_spacing)
 
     # If no gaps, return original path
-    if not gap_positions:
-        return [path]
-
-    # Build segments between gaps
-    segments_out = []
-    segment_start = 0.0
-
-    for gap_start, gap_end in gap_positions:
-        # Add segment before this gap
-        if segment_start < gap_start:
-            try:
-                t_start = segment_start / total_length
-                t_end = gap_start / total_length
-
-                # Ensure valid range
-                t_start = max(0.0, min(1.0, t_start))
-                t_end = max(0.0, min(1.0, t_end))
-
-                if t_end > t_start:
-                    seg = path.cropped(t_start, t_end)
-                    if len(seg) > 0:
-                        segments_out.append(seg)
-            except Exception as e:
-                # Skip this segment if cropping fails
-                pass
-
-        # Move past the gap
-        segment_start = gap_end
-
-    # Add final segment after last gap
-    if segment_start < total_length:
-        try:
-            t_start = segment_start / total_length
-            t_start = max(0.0, min(1.0, t_start))
-
-            if t_start < 1.0:
-                seg = path.cropped(t_start, 1.0)
-                if len(seg) > 0:
-                    segments_out.append(seg)
-        except Exception as e:
-            # Skip if cropping fails
-            pass
-
-    return segments_out if segments_out else [path]
-
-
-def path_to_svg_d(path: SvgPath) -> str:
-    """Convert a Path object back to SVG d attribute string."""
-    return path.d()
-
-
-def write_svg_with_gaps(paths: List[SvgPath], svg_attrs: dict,
+    if len(gaps) == 0:
+        return [(ctrl, kinds)]
+
+    # Pieces run from the end of one gap to the start of the next
+    starts = np.concatenate(([0.0], gaps[:, 1]))
+    ends = np.concatenate((gaps[:, 0], [total_length]))
+    keep = starts < ends
+    if not keep.any():
+        return [(ctrl, kinds)]
+
+    # Resolve every piece boundary to (segment, t) in one lookup
+    cum_lengths = np.concatenate(([0.0], np.cumsum(seg_lengths, dtype=np.float64)))
+    bounds = np.stack([starts[keep], ends[keep]], axis=1).ravel()
+    idx, t = _locate(bounds, cum_lengths, seg_tables)
+
+    out, out_kinds, offsets = _crop_pieces(ctrl, kinds, idx, t)
+    segments_out = [(out[lo:hi], out_kinds[lo:hi])
+                    for lo, hi in zip(offsets[:-1], offsets[1:]) if hi > lo]
+
+    return segments_out if segments_out else [(ctrl, kinds)]
+
+
+def _format_number(value: float, precision: int) -> str:
+    """Format a coordinate with at most `precision` decimals, no trailing zeros."""
+    text = f"{value:.{precision}f}"
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+
+def ctrl_to_relative_d(ctrl: np.ndarray, kinds: np.ndarray,
+                       precision: int = 3) -> Tuple[float, float, str]:
+    """
+    Convert cubic control points to relative SVG path data.
+
+    Everything after the first point uses relative commands, so the
+    result can be placed anywhere by prefixing an absolute move. Line
+    segments are written as l, everything else as c.
+    Coordinates are rounded before deltas are taken so the rounding
+    error does not accumulate along the path.
+
+    Returns:
+        (start x, start y, path data following the initial move)
+    """
+    pts = np.round(ctrl, precision)
+    starts = pts[:, 0].tolist()
+    ends = pts[:, 3].tolist()
+    deltas = np.round(pts[:, 1:] - pts[:, :1], precision).reshape(-1, 6).tolist()
+
+    parts = []
+    cursor = starts[0]
+    command = None
+    for start, end, delta, kind in zip(starts, ends, deltas, kinds.tolist()):
+        if start != cursor:
+            parts.append('m' + _format_number(round(start[0] - cursor[0], precision), precision)
+                         + ' ' + _format_number(round(start[1] - cursor[1], precision), precision))
+            command = None
+        if kind == SEG_LINE:
+            letter, values = 'l', delta[4:]
+        else:
+            letter, values = 'c', delta
+        # Repeated commands are implicit after the first
+        prefix = '' if letter == command else letter
+        parts.append(prefix + ' '.join([_format_number(v, precision) for v in values]))
+        command = letter
+        cursor = end
+    return starts[0][0], starts[0][1], ' '.join(parts)
+
+
+def _svg_move(x: float, y: float, precision: int) -> str:
+    """Absolute moveto command for the start of a d string."""
+    return f"M{_format_number(x, precision)} {_format_number(y, precision)} "
+
+
+# Per-process memo of gapped output, keyed on translation-normalized geometry
+_GAP_CACHE = {}
+
+
+def _gap_worker(job: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray,
+                           float, bytes, float, float, int]) -> List[str]:
+    """
+    Pool worker: insert gaps into one path.
+
+    Drawings often repeat the same shape at different positions, so the
+    gapped pieces are memoized on the path's geometry relative to its
+    first point; translated copies then share one cache entry and only
+    need their absolute start points rewritten.
+
+    Results come back as d strings, which are cheap to pickle.
+
+    Returns:
+        List of d strings for the gapped segments
+    """
+    (ctrl, kinds, seg_lengths, seg_tables, total_length, key,
+     gap_length, gap_spacing, precision) = job
+    # A bare move (e.g. "M10 10 z") has no segments and no first point
+    if len(ctrl) == 0:
+        return []
+    origin = ctrl[0, 0]
+    shape = ctrl - origin
+
+    key = (key, gap_length, gap_spacing, precision)
+    pieces = _GAP_CACHE.get(key)
+    if pieces is None:
+        segments = insert_gaps_in_path(shape, kinds, seg_lengths, seg_tables,
+                                       gap_length, gap_spacing, total_length)
+        pieces = [ctrl_to_relative_d(seg, seg_kinds, precision)
+                  for seg, seg_kinds in segments]
+        _GAP_CACHE[key] = pieces
+
+    ox, oy = origin.tolist()
+    return [_svg_move(round(ox + x, precision), round(oy + y, precision), precision) + rest
+            for x, y, rest in pieces]
+
+
+def viewbox_height(svg_attrs: dict) -> float:
+    """Height of the SVG viewBox (1000 if it is missing or malformed)."""
+    viewbox_parts = svg_attrs.get('viewBox', '').split()
+    if len(viewbox_parts) == 4:
+        return float(viewbox_parts[3])
+    return 1000.0
+
+
+def flip_y(ctrl: np.ndarray, height: float) -> None:
+    """
+    Mirror control points vertically in place (y -> height - y).
+
+    potrace's output is upside down; flipping the coordinates once here
+    means the written SVG needs no transform for downstream tools to apply.
+    """
+    ys = ctrl[..., 1]
+    np.subtract(height, ys, out=ys)
+
+
+def write_svg_with_gaps(d_strings: List[str], svg_attrs: dict,
                         output_file: str, stroke_width: float = 1.0):
     """
-    Write paths to SVG file with specified stroke width.
+    Write path d strings to SVG file with specified stroke width.
+
+    The output structure is fixed (one svg, one styled g, N paths), so it
+    is written directly as bytes rather than built as an element tree.
     """
-    # Create SVG root
     svg_ns = "http://www.w3.org/2000/svg"
-    ET.register_namespace('', svg_ns)
-
-    # Parse viewBox to get dimensions for flipping
     viewbox = svg_attrs.get('viewBox', '0 0 1000 1000')
-    viewbox_parts = viewbox.split()
-    if len(viewbox_parts) == 4:
-        vb_height = float(viewbox_parts[3])
-    else:
-        vb_height = 1000
-
-    root = ET.Element('svg', {
-        'xmlns': svg_ns,
-        'viewBox': viewbox,
-        'width': svg_attrs.get('width', '100%'),
-        'height': svg_attrs.get('height', '100%')
-    })
-
-    # Create a group with transform to flip Y-axis
-    # This corrects the upside-down output from potrace
-    group = ET.SubElement(root, 'g', {
-        'transform': f'scale(1,-1) translate(0,-{vb_height})'
-    })
-
-    # Add paths to the group
-    for path in paths:
-        if len(path) == 0:
-            continue
-        path_elem = ET.SubElement(group, 'path', {
-            'd': path_to_svg_d(path),
-            'fill': 'none',
-            'stroke': 'black',
-            'stroke-width': str(stroke_width),
-            'stroke-linecap': 'round',
-            'stroke-linejoin': 'round'
-        })
-
-    # Write to file
-    tree = ET.ElementTree(root)
-    ET.indent(tree, space="  ")
-    tree.write(output_file, encoding='utf-8', xml_declaration=True)
-    print(f"✓ Wrote {len(paths)} gapped paths to {output_file}")
+
+    # Styling lives on the group; SVG presentation attributes inherit, so
+    # each path only needs its d attribute. Coordinates are already flipped
+    # (see flip_y), so no transform is needed.
+    header = (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        f'<svg xmlns="{svg_ns}" viewBox={quoteattr(viewbox)}'
+        f' width={quoteattr(svg_attrs.get("width", "100%"))}'
+        f' height={quoteattr(svg_attrs.get("height", "100%"))}>\n'
+        f'  <g fill="none" stroke="black" stroke-width={quoteattr(str(stroke_width))}'
+        ' stroke-linecap="round" stroke-linejoin="round">\n'
+    )
+    path_head = b'    <path d="'
+    path_tail = b'"/>\n'
+
+    with open(output_file, 'wb') as out:
+        out.write(header.encode())
+        out.writelines(path_head + d.encode() + path_tail for d in d_strings if d)
+        out.write(b'  </g>\n</svg>\n')
+
+    print(f"✓ Wrote {len(d_strings)} gapped paths to {output_file}")
 
 
 def main():
@@ -317,8 +878,23 @@ def main():
                        help='Length of each gap in pixels (default: 3)')
     parser.add_argument('--gap-spacing', type=float, default=40.0,
                        help='Distance between gap starts in pixels (default: 40)')
+    parser.add_argument('--min-path-length', type=float, default=None,
+                       help='Drop paths shorter than this many pixels'
+                            ' (default: gap length)')
     parser.add_argument('--stroke-width', type=float, default=1.0,
                        help='Stroke width in output SVG (default: 1.0)')
+    parser.add_argument('--threshold', type=int, default=128,
+                       help='Gray level separating black from white (default: 128)')
+    parser.add_argument('--otsu', action='store_true',
+                       help='Pick the threshold automatically with Otsu\'s method')
+    parser.add_argument('--precision', type=int, default=3,
+                       help='Decimal places for output coordinates (default: 3)')
+    parser.add_argument('--jobs', '-j', type=int, default=multiprocessing.cpu_count(),
+                       help='Worker processes for path parsing and gap insertion'
+                            ' (default: CPU count)')
+    parser.add_argument('--numba', action='store_true',
+                       help='JIT-compile gap insertion with numba (the first run'
+                            ' compiles for several seconds in each process)')
 
     args = parser.parse_args()
 
@@ -326,49 +902,104 @@ def main():
     if not check_potrace():
         return 1
 
-    # Create temporary SVG for potrace output
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.svg', delete=False) as tmp:
-        tmp_svg = tmp.name
-
-    try:
-        # Step 1: Vectorize with potrace
-        vectorize_with_potrace(args.input, tmp_svg)
-
-        # Step 2: Parse the SVG paths
-        paths, svg_attrs = parse_svg_paths(tmp_svg)
+    if args.numba and not enable_numba():
+        print("Warning: numba not found, gap insertion runs without JIT."
+              " Install with: pip install numba")
 
-        if not paths:
-            print("Error: No paths found in vectorized SVG")
-            return 1
+    # Step 1: Vectorize with potrace
+    svg_data = vectorize_with_potrace(args.input, args.threshold, args.otsu)
 
-        # Step 3: Insert gaps in each path
-        print(f"Inserting gaps (length={args.gap_length}px, spacing={args.gap_spacing}px)...")
-        gapped_paths = []
+    # Step 2: Parse the SVG paths
+    paths, svg_attrs = parse_svg_paths(svg_data, args.jobs)
 
-        for i, path in enumerate(paths):
-            path_length = path.length()
+    if not paths:
+        print("Error: No paths found in vectorized SVG")
+        return 1
 
-            if (i + 1) % 10 == 0 or path_length > 0:
-                print(f"  Path {i+1}/{len(paths)}: length={path_length:.1f}px", end="")
+    # Pack every path into one structure-of-arrays batch
+    batch = PathBatch.from_paths(paths)
+    del paths
+
+    # Correct potrace's upside-down output in the coordinates themselves
+    flip_y(batch.ctrl, viewbox_height(svg_attrs))
+
+    # Step 3: Insert gaps in each path
+    print(f"Inserting gaps (length={args.gap_length}px, spacing={args.gap_spacing}px)...")
+    gapped_paths = []
+
+    # Arc lengths for every segment of every path in one vectorized call
+    seg_lengths, seg_tables = segment_arclengths(batch.ctrl, batch.kinds)
+
+    # Path lengths are measured once here and passed down, not re-summed.
+    # Differences of one global running sum can be off from a per-path sum
+    # in the last bits, which may flip the last printed digit of a gap end
+    offsets = batch.path_offsets
+    cum_lengths = np.concatenate(([0.0], np.cumsum(seg_lengths, dtype=np.float64)))
+    path_lengths = (cum_lengths[offsets[1:]] - cum_lengths[offsets[:-1]]).tolist()
+
+    # Speckles below --min-path-length are dropped outright, and paths too
+    # short to hold a gap are emitted whole without a round trip through a
+    # worker. Slots keep every path in its original position in the output.
+    min_length = args.gap_length if args.min_path_length is None else args.min_path_length
+    slots = []
+    jobs = []
+    job_slots = []
+    dropped = 0
+    for lo, hi, length, key in zip(offsets[:-1].tolist(), offsets[1:].tolist(),
+                                   path_lengths, batch.shape_keys):
+        # Bare moves (e.g. "M10 10 z") have no segments and draw nothing
+        if hi == lo:
+            continue
+        if length < min_length:
+            dropped += 1
+            continue
+        ctrl, kinds = batch.ctrl[lo:hi], batch.kinds[lo:hi]
+        if length < args.gap_length:
+            x, y, rest = ctrl_to_relative_d(ctrl, kinds, args.precision)
+            slots.append([_svg_move(x, y, args.precision) + rest])
+            continue
+        job_slots.append(len(slots))
+        slots.append(None)
+        jobs.append((ctrl, kinds, seg_lengths[lo:hi], seg_tables[lo:hi],
+                     length, key, args.gap_length, args.gap_spacing, args.precision))
+
+    # Each path is independent, so fan the work out across processes.
+    # imap keeps the output in input order while still streaming results.
+    if args.jobs > 1 and len(jobs) > 1:
+        chunksize = max(1, len(jobs) // (4 * args.jobs))
+        pool = multiprocessing.Pool(args.jobs,
+                                    initializer=enable_numba if args.numba else None)
+        results = pool.imap(_gap_worker, jobs, chunksize=chunksize)
+    else:
+        pool = None
+        results = map(_gap_worker, jobs)
 
-            segments = insert_gaps_in_path(path, args.gap_length, args.gap_spacing)
+    # Per-path prints dominate on dense drawings; show a rate-limited bar
+    # on interactive terminals only and a single summary line otherwise
+    if tqdm is not None and sys.stdout.isatty():
+        results = tqdm(results, total=len(jobs), desc='Gap insertion', unit='path')
 
-            if (i + 1) % 10 == 0 or path_length > 0:
-                print(f" -> {len(segments)} segments")
+    try:
+        for slot, segments in zip(job_slots, results):
+            slots[slot] = segments
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
-            gapped_paths.extend(segments)
+    for segments in slots:
+        gapped_paths.extend(segments)
 
-        print(f"✓ Generated {len(gapped_paths)} path segments with gaps")
+    if dropped:
+        print(f"  Dropped {dropped} paths shorter than {min_length}px")
 
-        # Step 4: Write output SVG
-        write_svg_with_gaps(gapped_paths, svg_attrs, args.output, args.stroke_width)
+    print(f"✓ Generated {len(gapped_paths)} path segments with gaps"
+          f" from {len(batch)} paths ({sum(path_lengths):.1f}px total)")
 
-        print(f"\n✓ Complete! Output written to {args.output}")
+    # Step 4: Write output SVG
+    write_svg_with_gaps(gapped_paths, svg_attrs, args.output, args.stroke_width)
 
-    finally:
-        # Clean up temp file
-        if os.path.exists(tmp_svg):
-            os.unlink(tmp_svg)
+    print(f"\n✓ Complete! Output written to {args.output}")
 
     return 0
 